@@ -3,6 +3,8 @@ This is an example application showing how to use the canvas to control pixels t
 From here, try some of the other canvas-related functions, like the ones to draw lines and arcs.
 """
 
+from array import array
+import micropython
 import uasyncio as aio  # type: ignore
 
 from apps.base_app import BaseApp
@@ -12,27 +14,43 @@ from ui.page import Page
 import ui.styles as styles
 import lvgl
 
+# ulab brings numpy-style arrays to micropython, but it isn't built into every firmware image
+try:
+    import ulab.numpy as np  # type: ignore
+except ImportError:
+    np = None
+
+# The render native module calculates whole columns in C. It has to be built from natmod/render and copied to lib/ on the
+# badge, so fall back to calculating in Python when it isn't there
+try:
+    from render import mandelbrot_columns  # type: ignore
+except ImportError:
+    mandelbrot_columns = None
+
 # This cycles through red, green, and blue with 8 bits per color channel on a scalable counter_value
+@micropython.native
 def cycle_colors(counter_value, max_counter):
     red = 0
     green = 0
     blue = 0
-    threshold_count = max_counter/3
-    threshold0 = threshold_count
+    threshold0 = max_counter/3
     threshold1 = 2*max_counter/3
+    # Each part of the cycle ramps a channel through 0xFF over a third of max_counter. Dividing is much slower than
+    # multiplying, so work out the step per count once
+    color_step = 3*0xFF/max_counter
 
     # There are three parts of the cycle:
     if counter_value >= 0 and counter_value < threshold0:
         # Transition the colors from black to red
-        red = counter_value*0xFF/(threshold_count)
+        red = counter_value*color_step
     elif counter_value >= threshold0 and counter_value < threshold1:
         # Transition the colors from green to blue
-        red = 0xFF-(counter_value-threshold0)*0xFF/(threshold_count)
-        green = (counter_value-threshold0)*0xFF/(threshold_count)
+        red = 0xFF-(counter_value-threshold0)*color_step
+        green = (counter_value-threshold0)*color_step
     elif counter_value < max_counter:
         # Transition the colors from green to blue
-        green = 0xFF-(counter_value-threshold1)*0xFF/(threshold_count)
-        blue = (counter_value-threshold1)*0xFF/(threshold_count)
+        green = 0xFF-(counter_value-threshold1)*color_step
+        blue = (counter_value-threshold1)*color_step
     else:
         blue = 0xFF
 
@@ -41,25 +59,89 @@ def cycle_colors(counter_value, max_counter):
     return new_color
 
 # This translates from a 24-bit color space to a 16-bit color space, where red and blue are 5 bits and green is 6 bits
-def generate_565_color(red_byte, green_byte, blue_byte):
-    # Mask and shift each color to the correct place
-    return ((red_byte&0xF8)<<8) | ((green_byte&0xFC)<<3) | ((blue_byte&0xF8)>>3)
-
-# Calculate an iteration of the mandelbrot
-def mandelbrot(z, c):
-    # z_real^2 + z_imag^2 + c_real
-    new_z_real = z[0] * z[0] + c[0] - z[1] * z[1]
-    # 2*z_imag*z_real + c_imag
-    new_z_imag = 2*z[0]*z[1] + c[1]
-    return (new_z_real, new_z_imag)
+@micropython.viper
+def rgb888_to_565(color_24bit: int) -> int:
+    # Shift each color straight from the 24-bit color to the correct place and mask off the bits that don't fit
+    return ((color_24bit>>8)&0xF800) | ((color_24bit>>5)&0x07E0) | ((color_24bit>>3)&0x001F)
 
 # Run the mandelbrot calculation several times and returns how many iterations needed to exceed 2 or iterations+1 if it never does so
-def mandelbrot_iter(z, c, bound_number, iterations):
+# z and c are passed as separate real and imaginary parts, so no tuples are allocated while iterating
+@micropython.native
+def mandelbrot_iter(z_real, z_imag, c_real, c_imag, iterations):
+    # The squares are needed both for the escape check and the next iteration, so only calculate them once
+    z_real_squared = z_real*z_real
+    z_imag_squared = z_imag*z_imag
+    for iteration in range(iterations):
+        # 2*z_imag*z_real + c_imag
+        z_imag = 2*z_real*z_imag + c_imag
+        # z_real^2 - z_imag^2 + c_real
+        z_real = z_real_squared - z_imag_squared + c_real
+        z_real_squared = z_real*z_real
+        z_imag_squared = z_imag*z_imag
+        # Once |z| > 2 the point is guaranteed to escape, and comparing the squared magnitude avoids a square root
+        if z_real_squared + z_imag_squared > 4.0:
+            return iteration
+    return iterations+1
+
+# Points inside the main cardioid or the period-2 bulb never escape, and they're where most of the iterations are spent,
+# so check for them directly
+@micropython.native
+def in_main_bulbs(c_real, c_imag):
+    cardioid_real = c_real - 0.25
+    q = cardioid_real*cardioid_real + c_imag*c_imag
+    return q*(q + cardioid_real) < 0.25*c_imag*c_imag or (c_real + 1)*(c_real + 1) + c_imag*c_imag < 0.0625
+
+# Run the mandelbrot calculation on a whole column of c values at once using ulab, writing the iteration counts
+# mandelbrot_iter would give for each of them into counts
+# Each part of the calculation is kept in its own array with one entry per point. The arrays are allocated once per frame
+# and updated in place, so the iterations don't allocate new arrays for every step
+def mandelbrot_column(c_real, c_imag, c_imag_squared, iterations, z_real, z_imag, z_real_squared, z_imag_squared, counts):
+    z_real[:] = 0.0
+    z_imag[:] = 0.0
+    z_real_squared[:] = 0.0
+    z_imag_squared[:] = 0.0
+    counts[:] = 0
+    # Points inside the main bulbs never escape, so skip iterating them
+    cardioid_real = c_real - 0.25
+    q = c_imag_squared + cardioid_real*cardioid_real
+    inside = np.logical_or(q*(q + cardioid_real) < 0.25*c_imag_squared, c_imag_squared + (c_real + 1)*(c_real + 1) < 0.0625)
+    # Points that haven't escaped yet
+    remaining = np.logical_not(inside)
     for iteration in range(iterations):
-        z = mandelbrot(z, c)
-        if z[0] > bound_number or z[0] < -bound_number or z[1] > bound_number or z[1] < -bound_number:
-            return (iteration, z)
-    return (iterations+1, z)
+        # 2*z_imag*z_real + c_imag
+        z_imag *= z_real
+        z_imag *= 2.0
+        z_imag += c_imag
+        # z_real^2 - z_imag^2 + c_real, reusing the squares from the escape check
+        z_real[:] = z_real_squared
+        z_real -= z_imag_squared
+        z_real += c_real
+        z_real_squared[:] = z_real
+        z_real_squared *= z_real
+        z_imag_squared[:] = z_imag
+        z_imag_squared *= z_imag
+        escaped = z_real_squared + z_imag_squared > 4.0
+        remaining = np.logical_and(remaining, np.logical_not(escaped))
+        # Each point counts the iterations before the one where it escaped
+        counts += remaining
+        if not np.any(remaining):
+            break
+    # Points that never escaped get iterations+1
+    counts += remaining
+    counts[inside] = iterations+1
+
+# Look up the RGB565 color for the iteration count of each calculated row in a column and write it to the buffer
+@micropython.viper
+def write_column(canvas_buffer: ptr16, palette: ptr16, counts: ptr8, rows: ptr8, row_count: int, x: int, x_width: int):
+    i: int = 0
+    while i < row_count:
+        canvas_buffer[x + x_width*rows[i]] = palette[counts[i]]
+        i += 1
+
+# How many columns of the mandelbrot to render each time the app runs in the foreground
+COLUMNS_PER_PASS = 8
+# Stop zooming out once the whole mandelbrot fits on the screen. The last frame never changes, so it's kept as is
+MIN_ZOOM_FACTOR = 50.0
 
 class App(BaseApp):
     """Define a new app to run on the badge."""
@@ -71,34 +153,121 @@ class App(BaseApp):
         If the app only runs in the background, you can delete this method.
         """
 
+        # The final frame is already in the canvas buffer, so there's nothing left to calculate
+        if self.zoom_finished:
+            return
+
+        # Start calculating a new frame if the last one is done
+        if self.next_x == 0:
+            self._start_frame()
+
+        # Only render a few columns each pass, so the radio and keyboard aren't blocked while the whole frame is calculated
+        end_x = min(self.next_x + COLUMNS_PER_PASS, self.x_width)
+        self._render_columns(self.next_x, end_x)
+        self.next_x = end_x
+
+        if self.next_x == self.x_width:
+            self._finish_frame()
+            self.next_x = 0
+
+    def _start_frame(self):
+        # The mandelbrot is symmetric about the real axis, so rows that mirror an already calculated row across it can
+        # be copied instead of calculated. To make mirrored rows line up exactly, the real axis is snapped to the nearest
+        # half pixel, which moves the view by at most a quarter of a pixel.
+        # mirror_sum is twice the row the real axis lies on, so row y mirrors row mirror_sum - y
+        self.mirror_sum = round(self.y_height + 2*self.zoom_center_y*self.zoom_factor)
+        self.center_y = self.mirror_sum/2
+        # The screen is less than 256 pixels tall, so the calculated rows fit in a bytearray the viper code can read
+        self.calculated_rows = bytearray()
+        self.mirrored_rows = []
+        for y in range(self.y_height):
+            if 0 <= self.mirror_sum - y < y:
+                self.mirrored_rows.append(y)
+            else:
+                self.calculated_rows.append(y)
+
+        self.zoom_scale = 1.0/self.zoom_factor
+        # This is the real part of c for the leftmost column
+        self.left_c_real = self.zoom_center_x - (self.x_width/2)*self.zoom_scale
+        # The real part of c only depends on the column and the imaginary part only on the row, so work them out once
+        # per frame instead of for every pixel
+        self.column_c_real = [self.left_c_real + x*self.zoom_scale for x in range(self.x_width)]
+
+        if np is not None:
+            self.c_imag = (self.center_y - np.array(self.calculated_rows))*self.zoom_scale
+            self.c_imag_squared = self.c_imag*self.c_imag
+            # These hold the state of every point in a column while it's being calculated
+            row_count = len(self.calculated_rows)
+            self.z_real = np.zeros(row_count)
+            self.z_imag = np.zeros(row_count)
+            self.z_real_squared = np.zeros(row_count)
+            self.z_imag_squared = np.zeros(row_count)
+            self.counts = np.zeros(row_count, dtype=np.uint8)
+        else:
+            self.row_c_imag = [(self.center_y - y)*self.zoom_scale for y in self.calculated_rows]
+            # This is where each calculated row starts in the canvas buffer
+            self.row_offsets = [y*self.x_width for y in self.calculated_rows]
+
+    def _render_columns(self, start_x, end_x):
+        # Attribute lookups and repeated arithmetic are slow in micropython, so pull everything used for each pixel into
+        # local variables first
+        x_width = self.x_width
+        canvas_buffer = self.canvas_buffer
+        palette = self.palette
+        calculated_rows = self.calculated_rows
+
+        if mandelbrot_columns is not None:
+            mandelbrot_columns(canvas_buffer, palette, calculated_rows, start_x, end_x, x_width,
+                               self.left_c_real, self.center_y, self.zoom_scale, 0xFE)
+            return
+
+        column_c_real = self.column_c_real
+        if np is None:
+            row_c_imag = self.row_c_imag
+            row_offsets = self.row_offsets
+
         # Loop through the pixels
-        for x in range(self.x_width):
-
-            # This is the x value for the graph
-            graph_x = x - self.x_width/2
-
-            for y in range(self.y_height):
-                # This is the y value for the graph
-                graph_y = self.y_height/2 - y
-
-                # For each pixel in the column, write the upper and lower bytes
-                z = (0.0, 0.0)
-                c = (graph_x/self.zoom_factor+self.zoom_center_x, graph_y/self.zoom_factor + self.zoom_center_y)
-                (iterations, z_result) = mandelbrot_iter(z, c, self.bound_number, 0xFE)
-                # print("Mandelbrot iteration " + str(iteration) + " for c=" + str(c[0]) + ": z_real: " + str(z[0]) + ", z_imag: " + str(z[1]))
-                # Then convert it to the display's RGB565 format
-                color_24bit = cycle_colors(iterations, 0xFF)
-                color =  generate_565_color((color_24bit>>16)&0xFF, (color_24bit>>8)&0xFF, color_24bit&0xFF)
-                
-                #Then get the upper and lower bytes of the color for writing to the buffer
-                upper_color_byte = color >> 8
-                lower_color_byte = color & 0xFF
-                self.canvas_buffer[2*x+self.x_width*2*y] = lower_color_byte
-                self.canvas_buffer[2*x+1+self.x_width*2*y] = upper_color_byte
-            # By setting the buffer, we tell the display to update with the new data we've written to it
-            self.canvas.set_buffer(self.canvas_buffer,self.x_width,self.y_height,lvgl.COLOR_FORMAT.RGB565)
-        self.zoom_factor /= 4.0
+        for x in range(start_x, end_x):
+
+            # This is the real part of c for the column
+            c_real = column_c_real[x]
 
+            if np is not None:
+                # Calculate the whole column at once, then look up the RGB565 colors and write them to the buffer
+                mandelbrot_column(c_real, self.c_imag, self.c_imag_squared, 0xFE,
+                                  self.z_real, self.z_imag, self.z_real_squared, self.z_imag_squared, self.counts)
+                # The palette lookup happens while the counts are written, so the colors are never gathered into an array
+                write_column(canvas_buffer, palette, self.counts, calculated_rows, len(calculated_rows), x, x_width)
+            else:
+                for i in range(len(row_c_imag)):
+                    # This is the imaginary part of c for the row
+                    c_imag = row_c_imag[i]
+
+                    # Count the iterations for the pixel, then look up its RGB565 color and write it to the buffer
+                    if in_main_bulbs(c_real, c_imag):
+                        iterations = 0xFF
+                    else:
+                        iterations = mandelbrot_iter(0.0, 0.0, c_real, c_imag, 0xFE)
+                    canvas_buffer[x+row_offsets[i]] = palette[iterations]
+
+    def _finish_frame(self):
+        # Fill in the mirrored rows a whole row at a time
+        x_width = self.x_width
+        canvas_buffer = self.canvas_buffer
+        for y in self.mirrored_rows:
+            mirror_y = self.mirror_sum - y
+            canvas_buffer[y*x_width:(y+1)*x_width] = canvas_buffer[mirror_y*x_width:(mirror_y+1)*x_width]
+
+        # By setting the buffer, we tell the display to update with the new data we've written to it
+        # This is only done once the whole frame is finished, rather than after every column
+        self.canvas.set_buffer(canvas_buffer,x_width,self.y_height,lvgl.COLOR_FORMAT.RGB565)
+
+        if self.zoom_factor <= MIN_ZOOM_FACTOR:
+            self.zoom_finished = True
+            # Nothing is rendered from here on, so go back to the normal sleep between passes
+            self.foreground_sleep_ms = 100
+        else:
+            self.zoom_factor /= 4.0
 
     def switch_to_foreground(self):
         """Set the app as the active foreground app.
@@ -124,7 +293,8 @@ class App(BaseApp):
         self.bytes_per_pixel = 2
 
         # The canvas buffer stores the color data that is rendered to the screen
-        self.canvas_buffer = bytearray(self.x_width*self.y_height*self.bytes_per_pixel)
+        # It's an array of 16-bit words so each pixel's RGB565 color can be written in a single store
+        self.canvas_buffer = array("H", bytearray(self.x_width*self.y_height*self.bytes_per_pixel))
 
         # Give the buffer to the canvas with the information it needs to make sense of the data
         self.canvas.set_buffer(self.canvas_buffer,self.x_width,self.y_height,lvgl.COLOR_FORMAT.RGB565)
@@ -132,9 +302,21 @@ class App(BaseApp):
         # Center the canvas on the screen
         self.canvas.center()
 
+        # Converting iteration counts to colors is the same every time, so build a lookup table of the
+        # RGB565 color for every possible iteration count up front
+        self.palette = array("H", bytearray(256*self.bytes_per_pixel))
+        for i in range(256):
+            color_24bit = cycle_colors(i, 0xFF)
+            self.palette[i] = rgb888_to_565(color_24bit)
+
         # This tells where on the fractal we'll be rendering
         self.zoom_center_x = float(-0.74548)
         self.zoom_center_y = float(0.11669)
         self.zoom_factor = float(50_0000.0)
-        # This is the threshold we use to test how many iterations it takes to escape, so we can keep rendering pretty stuff
-        self.bound_number = 10.0**20
\ No newline at end of file
+
+        # This is the next column of the frame to render
+        self.next_x = 0
+        # This is set once the final frame has been rendered
+        self.zoom_finished = False
+        # Each pass is kept short, so only sleep long enough to let the radio and keyboard run between them
+        self.foreground_sleep_ms = 10
\ No newline at end of file
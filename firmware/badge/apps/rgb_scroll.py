@@ -3,6 +3,7 @@ This is an example application showing how to use the canvas to control pixels t
 From here, try some of the other canvas-related functions, like the ones to draw lines and arcs.
 """
 
+import micropython
 import uasyncio as aio  # type: ignore
 
 from apps.base_app import BaseApp
@@ -13,36 +14,40 @@ import ui.styles as styles
 import lvgl
 
 # This cycles through red, green, and blue with 8 bits per color channel on a scalable counter_value
+@micropython.native
 def cycle_colors(counter_value, max_counter):
     red = 0
     green = 0
     blue = 0
-    threshold_count = max_counter/3
-    threshold0 = threshold_count
+    threshold0 = max_counter/3
     threshold1 = 2*max_counter/3
+    # Each part of the cycle ramps a channel through 0xFF over a third of max_counter. Dividing is much slower than
+    # multiplying, so work out the step per count once
+    color_step = 3*0xFF/max_counter
 
     # There are three parts of the cycle:
     if counter_value >= 0 and counter_value < threshold0:
         # Transition the colors from blue to red
-        red = counter_value*0xFF/(threshold_count)
-        blue = 0xFF-(counter_value*0xFF/threshold_count)
+        red = counter_value*color_step
+        blue = 0xFF-counter_value*color_step
     elif counter_value >= threshold0 and counter_value < threshold1:
         # Transition the colors from red to green
-        red = 0xFF-(counter_value-threshold0)*0xFF/(threshold_count)
-        green = (counter_value-threshold0)*0xFF/(threshold_count)
+        red = 0xFF-(counter_value-threshold0)*color_step
+        green = (counter_value-threshold0)*color_step
     else:
         # Transition the colors from green to blue
-        green = 0xFF-(counter_value-threshold1)*0xFF/(threshold_count)
-        blue = (counter_value-threshold1)*0xFF/(threshold_count)
+        green = 0xFF-(counter_value-threshold1)*color_step
+        blue = (counter_value-threshold1)*color_step
 
     # Create the 24-bit color by combining the component colors
     new_color = (int(red)<<16) | (int(green)<<8) | int(blue)
     return new_color
 
 # This translates from a 24-bit color space to a 16-bit color space, where red and blue are 5 bits and green is 6 bits
-def generate_565_color(red_byte, green_byte, blue_byte):
-    # Mask and shift each color to the correct place
-    return ((red_byte&0xF8)<<8) | ((green_byte&0xFC)<<3) | ((blue_byte&0xF8)>>3)
+@micropython.viper
+def rgb888_to_565(color_24bit: int) -> int:
+    # Shift each color straight from the 24-bit color to the correct place and mask off the bits that don't fit
+    return ((color_24bit>>8)&0xF800) | ((color_24bit>>5)&0x07E0) | ((color_24bit>>3)&0x001F)
 
 class App(BaseApp):
     """Define a new app to run on the badge."""
@@ -62,11 +67,7 @@ class App(BaseApp):
             color_24bit = cycle_colors((x+self.pixel_shift)%self.x_width, self.x_width)
             
             # Then convert it to the display's RGB565 format
-            color =  generate_565_color(
-                                        (color_24bit>>16) & 0xFF,
-                                        (color_24bit>>8 ) & 0xFF,
-                                        (color_24bit    ) & 0xFF
-            )
+            color = rgb888_to_565(color_24bit)
             
             #Then get the upper and lower bytes of the color for writing to the buffer
             upper_color_byte = color >> 8
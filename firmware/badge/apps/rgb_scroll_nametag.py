@@ -3,6 +3,8 @@ This is an example application showing how to use the canvas to control pixels t
 From here, try some of the other canvas-related functions, like the ones to draw lines and arcs.
 """
 
+from array import array
+import micropython
 import uasyncio as aio  # type: ignore
 
 from apps.base_app import BaseApp
@@ -13,36 +15,63 @@ import ui.styles as styles
 import lvgl
 
 # This cycles through red, green, and blue with 8 bits per color channel on a scalable counter_value
+@micropython.native
 def cycle_colors(counter_value, max_counter):
     red = 0
     green = 0
     blue = 0
-    threshold_count = max_counter/3
-    threshold0 = threshold_count
+    threshold0 = max_counter/3
     threshold1 = 2*max_counter/3
+    # Each part of the cycle ramps a channel through 0xFF over a third of max_counter. Dividing is much slower than
+    # multiplying, so work out the step per count once
+    color_step = 3*0xFF/max_counter
 
     # There are three parts of the cycle:
     if counter_value >= 0 and counter_value < threshold0:
         # Transition the colors from blue to red
-        red = counter_value*0xFF/(threshold_count)
-        blue = 0xFF-(counter_value*0xFF/threshold_count)
+        red = counter_value*color_step
+        blue = 0xFF-counter_value*color_step
     elif counter_value >= threshold0 and counter_value < threshold1:
         # Transition the colors from red to green
-        red = 0xFF-(counter_value-threshold0)*0xFF/(threshold_count)
-        green = (counter_value-threshold0)*0xFF/(threshold_count)
+        red = 0xFF-(counter_value-threshold0)*color_step
+        green = (counter_value-threshold0)*color_step
     else:
         # Transition the colors from green to blue
-        green = 0xFF-(counter_value-threshold1)*0xFF/(threshold_count)
-        blue = (counter_value-threshold1)*0xFF/(threshold_count)
+        green = 0xFF-(counter_value-threshold1)*color_step
+        blue = (counter_value-threshold1)*color_step
 
     # Create the 24-bit color by combining the component colors
     new_color = (int(red)<<16) | (int(green)<<8) | int(blue)
     return new_color
 
 # This translates from a 24-bit color space to a 16-bit color space, where red and blue are 5 bits and green is 6 bits
-def generate_565_color(red_byte, green_byte, blue_byte):
-    # Mask and shift each color to the correct place
-    return ((red_byte&0xF8)<<8) | ((green_byte&0xFC)<<3) | ((blue_byte&0xF8)>>3)
+@micropython.viper
+def rgb888_to_565(color_24bit: int) -> int:
+    # Shift each color straight from the 24-bit color to the correct place and mask off the bits that don't fit
+    return ((color_24bit>>8)&0xF800) | ((color_24bit>>5)&0x07E0) | ((color_24bit>>3)&0x001F)
+
+# Fill rows first_row up to end_row of the buffer with copies of row. Each copy doubles the filled region,
+# so only a handful of memory copies are needed no matter how many rows there are
+def fill_rows(buffer, row, first_row, end_row):
+    row_length = len(row)
+    # Slicing a memoryview copies straight between the buffers without allocating a temporary array
+    buffer_view = memoryview(buffer)
+    start = first_row*row_length
+    end = end_row*row_length
+    buffer_view[start:start+row_length] = row
+    filled = row_length
+    while start + filled < end:
+        copy_length = min(filled, end - start - filled)
+        buffer_view[start+filled:start+filled+copy_length] = buffer_view[start:start+copy_length]
+        filled += copy_length
+
+# Copy source into dest rotated left by shift elements
+def rotate_into(dest, source, shift):
+    length = len(source)
+    dest_view = memoryview(dest)
+    source_view = memoryview(source)
+    dest_view[:length-shift] = source_view[shift:]
+    dest_view[length-shift:] = source_view[:shift]
 
 class App(BaseApp):
     """Define a new app to run on the badge."""
@@ -54,32 +83,21 @@ class App(BaseApp):
         If the app only runs in the background, you can delete this method.
         """
         # This slowly shifts the RGB across the screen left to right
-        self.pixel_shift -= 10
-
-        # Loop through the pixels
-        for x in range(self.x_width):
-            # For each column of pixels, determine what the color should be
-            color_24bit = cycle_colors((x+self.pixel_shift)%self.x_width, self.x_width)
-            
-            # Then convert it to the display's RGB565 format
-            color =  generate_565_color(
-                                        (color_24bit>>16) & 0xFF,
-                                        (color_24bit>>8 ) & 0xFF,
-                                        (color_24bit    ) & 0xFF
-            )
-            
-            #Then get the upper and lower bytes of the color for writing to the buffer
-            upper_color_byte = color >> 8
-            lower_color_byte = color & 0xFF
-
-            for y in range(self.y_height):
-                # For each pixel in the column, write the upper and lower bytes
-                if (x > 100 and x < 300) and (y > 50 and y < 100):
-                    self.canvas_buffer[2*x+self.x_width*2*y] = ~lower_color_byte
-                    self.canvas_buffer[2*x+1+self.x_width*2*y] = ~upper_color_byte
-                else:
-                    self.canvas_buffer[2*x+self.x_width*2*y] = lower_color_byte
-                    self.canvas_buffer[2*x+1+self.x_width*2*y] = upper_color_byte
+        self.pixel_shift = (self.pixel_shift - 10) % self.x_width
+
+        # Every row is the same except the ones behind the nametag, which have their colors inverted,
+        # so build each kind of row once and copy it into the rows of the canvas buffer
+        # Shifting the colors is just rotating the palette, which can be done with two copies
+        rotate_into(self.row, self.palette, self.pixel_shift)
+        rotate_into(self.inverted_row, self.inverted_palette, self.pixel_shift)
+        # Only the columns behind the nametag are inverted
+        self.inverted_row[:101] = self.row[:101]
+        self.inverted_row[300:] = self.row[300:]
+
+        # Fill the rows above, behind, and below the nametag
+        fill_rows(self.canvas_buffer, self.row, 0, 51)
+        fill_rows(self.canvas_buffer, self.inverted_row, 51, 100)
+        fill_rows(self.canvas_buffer, self.row, 100, self.y_height)
 
         # By setting the buffer, we tell the display to update with the new data we've written to it
         self.canvas.set_buffer(self.canvas_buffer,self.x_width,self.y_height,lvgl.COLOR_FORMAT.RGB565)
@@ -129,7 +147,8 @@ class App(BaseApp):
         self.bytes_per_pixel = 2
 
         # The canvas buffer stores the color data that is rendered to the screen
-        self.canvas_buffer = bytearray(self.x_width*self.y_height*self.bytes_per_pixel)
+        # It's an array of 16-bit words so each pixel's RGB565 color can be written in a single store
+        self.canvas_buffer = array("H", bytearray(self.x_width*self.y_height*self.bytes_per_pixel))
 
         # Give the buffer to the canvas with the information it needs to make sense of the data
         self.canvas.set_buffer(self.canvas_buffer,self.x_width,self.y_height,lvgl.COLOR_FORMAT.RGB565)
@@ -137,6 +156,19 @@ class App(BaseApp):
         # Center the canvas on the screen
         self.canvas.center()
 
+        # The colors of the columns only depend on their position in the cycle, so build a lookup table of the
+        # RGB565 color for every column up front
+        self.palette = array("H", bytearray(self.x_width*self.bytes_per_pixel))
+        self.inverted_palette = array("H", bytearray(self.x_width*self.bytes_per_pixel))
+        for i in range(self.x_width):
+            color_24bit = cycle_colors(i, self.x_width)
+            self.palette[i] = rgb888_to_565(color_24bit)
+            self.inverted_palette[i] = self.palette[i] ^ 0xFFFF
+
+        # These hold one row of the rainbow, and the same row with the colors behind the nametag inverted
+        self.row = array("H", bytearray(self.x_width*self.bytes_per_pixel))
+        self.inverted_row = array("H", bytearray(self.x_width*self.bytes_per_pixel))
+
         self.username = self.badge.config.get("nametag").decode().strip()
         self.nametag = lvgl.label(self.fullscreen)
         self.nametag.set_style_text_font(lvgl.font_montserrat_42, lvgl.STATE.DEFAULT)
@@ -0,0 +1,99 @@
+// Native module that renders columns of the mandelbrot app without going through the micropython interpreter.
+// It does the same calculation as the Python code in apps/mandelbrot.py, which is used when this module isn't installed.
+#include "py/dynruntime.h"
+
+// The iterations use fixed point numbers with 26 fractional bits, which is more precise than micropython's single precision
+// floats and keeps the inner loop to integer math. This leaves room for values up to 32, which covers c for every view the
+// app zooms through and z until it escapes.
+#define FRACTION_BITS 26
+#define TO_FIXED(value) ((int32_t)((value) * (float)(1 << FRACTION_BITS)))
+
+// Points inside the main cardioid or the period-2 bulb never escape, so check for them directly
+static bool in_main_bulbs(float c_real, float c_imag) {
+    float cardioid_real = c_real - 0.25f;
+    float q = cardioid_real * cardioid_real + c_imag * c_imag;
+    return q * (q + cardioid_real) < 0.25f * c_imag * c_imag
+           || (c_real + 1.0f) * (c_real + 1.0f) + c_imag * c_imag < 0.0625f;
+}
+
+// Returns how many iterations are needed for |z| to exceed 2, or iterations+1 if it never does so
+// c is in fixed point
+static mp_int_t mandelbrot_iter(int32_t c_real, int32_t c_imag, mp_int_t iterations) {
+    int32_t z_real = 0;
+    int32_t z_imag = 0;
+    // The squares can be larger than the fixed point range before the escape check, so keep them in 64 bits until then
+    int64_t z_real_squared = 0;
+    int64_t z_imag_squared = 0;
+    for (mp_int_t iteration = 0; iteration < iterations; iteration++) {
+        // Shifting by one bit less than the fraction multiplies by 2
+        z_imag = (int32_t)(((int64_t)z_real * z_imag) >> (FRACTION_BITS - 1)) + c_imag;
+        z_real = (int32_t)(z_real_squared - z_imag_squared) + c_real;
+        z_real_squared = ((int64_t)z_real * z_real) >> FRACTION_BITS;
+        z_imag_squared = ((int64_t)z_imag * z_imag) >> FRACTION_BITS;
+        if (z_real_squared + z_imag_squared > ((int64_t)4 << FRACTION_BITS)) {
+            return iteration;
+        }
+    }
+    return iterations + 1;
+}
+
+// mandelbrot_columns(canvas_buffer, palette, rows, start_x, end_x, x_width, left_c_real, center_y, zoom_scale, iterations)
+// Renders the given rows of columns start_x up to end_x into the RGB565 canvas buffer
+static mp_obj_t mandelbrot_columns(size_t n_args, const mp_obj_t *args) {
+    mp_buffer_info_t canvas_info;
+    mp_buffer_info_t palette_info;
+    mp_buffer_info_t rows_info;
+    mp_get_buffer_raise(args[0], &canvas_info, MP_BUFFER_WRITE);
+    mp_get_buffer_raise(args[1], &palette_info, MP_BUFFER_READ);
+    mp_get_buffer_raise(args[2], &rows_info, MP_BUFFER_READ);
+    uint16_t *canvas_buffer = canvas_info.buf;
+    const uint16_t *palette = palette_info.buf;
+    const uint8_t *rows = rows_info.buf;
+    mp_int_t start_x = mp_obj_get_int(args[3]);
+    mp_int_t end_x = mp_obj_get_int(args[4]);
+    mp_int_t x_width = mp_obj_get_int(args[5]);
+    float left_c_real = mp_obj_get_float_to_f(args[6]);
+    float center_y = mp_obj_get_float_to_f(args[7]);
+    float zoom_scale = mp_obj_get_float_to_f(args[8]);
+    mp_int_t iterations = mp_obj_get_int(args[9]);
+
+    // Check everything written and read stays inside the buffers
+    mp_int_t pixel_count = canvas_info.len / sizeof(uint16_t);
+    if (start_x < 0 || end_x > x_width || rows_info.len > 256
+        || (mp_int_t)(palette_info.len / sizeof(uint16_t)) < iterations + 2) {
+        mp_raise_ValueError(MP_ERROR_TEXT("out of range"));
+    }
+    for (size_t i = 0; i < rows_info.len; i++) {
+        if ((mp_int_t)rows[i] * x_width + x_width > pixel_count) {
+            mp_raise_ValueError(MP_ERROR_TEXT("out of range"));
+        }
+    }
+
+    // The imaginary part of c is the same for every column, so convert it for each row once
+    float c_imag[256];
+    int32_t c_imag_fixed[256];
+    for (size_t i = 0; i < rows_info.len; i++) {
+        c_imag[i] = (center_y - rows[i]) * zoom_scale;
+        c_imag_fixed[i] = TO_FIXED(c_imag[i]);
+    }
+
+    for (mp_int_t x = start_x; x < end_x; x++) {
+        float c_real = left_c_real + x * zoom_scale;
+        int32_t c_real_fixed = TO_FIXED(c_real);
+        for (size_t i = 0; i < rows_info.len; i++) {
+            mp_int_t count = in_main_bulbs(c_real, c_imag[i]) ? iterations + 1 : mandelbrot_iter(c_real_fixed, c_imag_fixed[i], iterations);
+            canvas_buffer[x + x_width * rows[i]] = palette[count];
+        }
+    }
+    return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(mandelbrot_columns_obj, 10, 10, mandelbrot_columns);
+
+// This is the entry point and is called when the module is imported
+mp_obj_t mpy_init(mp_obj_fun_bc_t *self, size_t n_args, size_t n_kw, mp_obj_t *args) {
+    MP_DYNRUNTIME_INIT_ENTRY
+
+    mp_store_global(MP_QSTR_mandelbrot_columns, MP_OBJ_FROM_PTR(&mandelbrot_columns_obj));
+
+    MP_DYNRUNTIME_INIT_EXIT
+}